@@ -0,0 +1,24 @@
+import os
+from dotenv import load_dotenv
+
+# Load environment variables from .env file (once, for the whole application)
+load_dotenv()
+
+# API Security Key expected in the X-API-KEY header
+API_KEY = os.getenv("API_KEY")
+
+# Supabase credentials and table
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+TABLE_NAME = "prescriptions"
+
+# Largest accepted upload request body in bytes, multipart framing included (override with MAX_UPLOAD_BYTES)
+MAX_UPLOAD = int(os.getenv("MAX_UPLOAD_BYTES", 20 * 1024 * 1024))
+
+# Uvicorn worker processes (uvicorn reads WEB_CONCURRENCY too; `python main.py` defaults it to the CPU count)
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY") or 1)
+# OCR processes per Uvicorn worker; by default the CPUs are shared out between the workers
+OCR_WORKERS = int(os.getenv("OCR_WORKERS") or max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY))
+
+# Set OCR_PREPROCESS=false to OCR the raw upload instead of the preprocessed image (useful for debugging)
+OCR_PREPROCESS = os.getenv("OCR_PREPROCESS", "true").lower() not in ("0", "false", "no")
@@ -1,13 +1,11 @@
-import os
+import hmac
 from fastapi import Security, HTTPException, status
 from fastapi.security import APIKeyHeader
-from dotenv import load_dotenv
+from config import API_KEY
 
-# Load environment variables from .env file
-load_dotenv()
-
-API_KEY = os.getenv("API_KEY")
 API_KEY_NAME = "X-API-KEY" # Standard header name for API keys
+# Encode the expected key once so each request only encodes the provided header
+API_KEY_BYTES = API_KEY.encode("utf-8") if API_KEY else None
 
 api_key_header = APIKeyHeader(name=API_KEY_NAME, auto_error=False)
 
@@ -15,19 +13,26 @@ async def get_api_key(api_key_header: str = Security(api_key_header)):
     """
     Dependency function to verify the API key.
     Retrieves the API key from the X-API-KEY header and compares it
-    to the expected API_KEY from environment variables.
+    to the expected API_KEY from environment variables using a
+    constant-time comparison to avoid leaking the key through timing.
     """
-    if not API_KEY:
+    if not API_KEY_BYTES:
         # This should not happen in production if configured correctly
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="API Key not configured on the server.",
         )
 
-    if api_key_header == API_KEY:
-        return api_key_header
-    else:
+    if api_key_header is None:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
-        )
\ No newline at end of file
+        )
+
+    provided = api_key_header.encode("utf-8", errors="ignore")
+    if not hmac.compare_digest(provided, API_KEY_BYTES):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Could not validate credentials",
+        )
+    return api_key_header
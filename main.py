@@ -1,40 +1,136 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+
+# Configure logging once, before the application modules are imported.
+# Records are handed to a queue and written to stderr by a listener thread, so a slow
+# stdout/stderr never blocks the event loop.
+# This module can run more than once in a process (`python main.py` runs it as __main__ and
+# Uvicorn then imports "main:app"), so skip the setup if a QueueHandler is already installed.
+if not any(isinstance(handler, logging.handlers.QueueHandler) for handler in logging.root.handlers):
+    _log_queue = queue.SimpleQueue()
+    _log_handler = logging.StreamHandler()
+    _log_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    _log_listener = logging.handlers.QueueListener(_log_queue, _log_handler)
+    logging.root.setLevel(logging.INFO)
+    logging.root.addHandler(logging.handlers.QueueHandler(_log_queue)) # Unformatted: the listener's handler formats
+    _log_listener.start()
+    atexit.register(_log_listener.stop) # Flush any queued records on exit
+
+import io
 import os
 import uvicorn
 from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, status, Path
+from fastapi.responses import JSONResponse
 # APIKey class is not directly used for type hinting with Depends, the dependency function handles it.
-from dotenv import load_dotenv
-import logging
 
 # Import custom modules
+from config import MAX_UPLOAD # Importing config also loads the .env file
 from models import PrescriptionData, PrescriptionUploadResponse, PatientDataResponse
-from ocr_processor import process_prescription_image
-from supabase_client import save_prescription_data, get_patient_data_from_db, supabase # Import supabase client instance for check
+from ocr_processor import process_prescription_image, log_tesseract_info, start_ocr_batcher, stop_ocr_batcher
+from supabase_client import save_prescription_data, get_patient_data_from_db, init_supabase, close_supabase
 from dependencies import get_api_key
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Load environment variables from .env file
-load_dotenv()
+# --- Upload Limits ---
+UPLOAD_CHUNK_SIZE = 64 * 1024 # Read uploads in 64 KiB chunks
 
 # --- FastAPI App Initialization ---
+# Responses are serialized straight to JSON bytes by Pydantic (FastAPI >= 0.130) because every
+# route declares a response_model; setting a custom default_response_class would disable that.
 app = FastAPI(
     title="Medical AI Prescription Processor",
     description="API to upload OPD prescription images, extract data using OCR, and store it in Supabase.",
     version="0.1.0",
 )
 
+# --- Request Size Limit ---
+# FastAPI parses the multipart body (spooling it to disk) before the endpoint runs, so the
+# upload limit is enforced here, at the ASGI level: first from the Content-Length header, then
+# by counting body bytes as they arrive, since the header can be missing (chunked uploads) or wrong.
+# The limit applies to the whole request body, multipart boundaries and part headers included.
+
+class UploadTooLargeError(HTTPException):
+    """Raised while the request body is being received once it exceeds the upload limit."""
+
+    def __init__(self, max_size: int):
+        super().__init__(
+            status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+            detail=f"Request body too large. Maximum request body size is {max_size} bytes."
+        )
+
+class UploadSizeLimitMiddleware:
+    """ASGI middleware that rejects request bodies larger than max_size bytes with a 413."""
+
+    def __init__(self, app, max_size: int):
+        self.app = app
+        self.max_size = max_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > self.max_size:
+            logger.warning(f"Rejected request with Content-Length {content_length.decode()} (limit {self.max_size} bytes)")
+            await self._reject(scope, receive, send)
+            return
+
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_size:
+                    logger.warning(f"Rejected request body after {received} bytes (limit {self.max_size} bytes)")
+                    # An HTTPException passes through FastAPI's body parsing and becomes the 413 response
+                    raise UploadTooLargeError(self.max_size)
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except UploadTooLargeError:
+            # Only reached if something other than a FastAPI route was reading the body
+            if response_started:
+                raise
+            await self._reject(scope, receive, send)
+
+    async def _reject(self, scope, receive, send):
+        error = UploadTooLargeError(self.max_size)
+        response = JSONResponse(status_code=error.status_code, content={"detail": error.detail})
+        await response(scope, receive, send)
+
+app.add_middleware(UploadSizeLimitMiddleware, max_size=MAX_UPLOAD)
+
 # --- Dependency Check ---
-# Check if Supabase client is initialized on startup
+# Initialize the Supabase client on startup and check that it succeeded
 @app.on_event("startup")
 async def startup_event():
-    if not supabase:
+    if not await init_supabase():
         logger.critical("Supabase client failed to initialize. Check SUPABASE_URL and SUPABASE_KEY environment variables.")
         # You might want to prevent the app from starting fully if Supabase is essential
         # For now, it will log a critical error. Endpoints requiring Supabase will fail.
     else:
         logger.info("FastAPI application started. Supabase client is initialized.")
+    log_tesseract_info()
+    start_ocr_batcher()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    stop_ocr_batcher()
+    await close_supabase()
 
 # --- API Endpoints ---
 
@@ -57,17 +153,28 @@ async def upload_prescription(
     """
     logger.info(f"Received file upload request for: {file.filename}")
 
-    # Read image bytes
+    # Read image bytes in chunks (the request body size was already limited by UploadSizeLimitMiddleware)
     try:
-        image_bytes = await file.read()
-        if not image_bytes:
+        buffer = io.BytesIO()
+        total_bytes = 0
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            total_bytes += len(chunk)
+            buffer.write(chunk)
+        if not total_bytes:
              raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No file content received.")
-        logger.info(f"Read {len(image_bytes)} bytes from uploaded file.")
+        # getvalue() hands over the buffer's bytes without copying (no views of it are exported);
+        # a memoryview would be copied again when it's sent to the OCR worker process
+        image_bytes = buffer.getvalue()
+        logger.info(f"Read {total_bytes} bytes from uploaded file.")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error reading uploaded file: {e}")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Error reading file: {e}")
     finally:
-        await file.close() # Ensure file is closed
+        # Close now rather than leaving it to FastAPI's cleanup at the end of the request, so a
+        # spooled temp file is released before the slow OCR step. In-memory uploads close inline.
+        await file.close()
 
     # Process image with OCR
     try:
@@ -103,12 +210,15 @@ async def upload_prescription(
 
         logger.info(f"Data successfully saved to Supabase for patient_id: {saved_record.get('patient_id')}")
         # Ensure the patient_id from the DB response is used if it differs (shouldn't with UUID)
-        final_patient_id = saved_record.get('patient_id', extracted_data.patient_id)
+        final_patient_id = str(saved_record.get('patient_id', extracted_data.patient_id))
 
-        return PrescriptionUploadResponse(
+        # The saved row echoes back the values we just validated and inserted, so reuse the
+        # validated model rather than validating the record again (FastAPI doesn't re-validate
+        # model instances, leaving a single serialization pass for the response)
+        return PrescriptionUploadResponse.model_construct(
             message="Prescription uploaded and processed successfully.",
             patient_id=final_patient_id,
-            extracted_data=PrescriptionData(**saved_record) # Use saved data for response consistency
+            extracted_data=extracted_data.model_copy(update={"patient_id": final_patient_id})
         )
 
     except HTTPException as http_err:
@@ -166,7 +276,14 @@ async def get_patient_data(
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000)) # Default to port 8000
     host = os.environ.get("HOST", "127.0.0.1") # Default to localhost
-    logger.info(f"Starting Uvicorn server on {host}:{port}")
+    # Number of worker processes; tune with WEB_CONCURRENCY (defaults to the CPU count)
+    workers = int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 2))
+    # Export the count so each worker sizes its OCR process pool to its share of the CPUs
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    logger.info(f"Starting Uvicorn server on {host}:{port} with {workers} worker(s)")
     # Ensure Tesseract is installed and configured before running.
     # Ensure .env file exists with SUPABASE_URL, SUPABASE_KEY, and API_KEY.
-    uvicorn.run(app, host=host, port=port)
\ No newline at end of file
+    # An import string is required when running more than one worker.
+    # "auto" uses uvloop and httptools when installed (uvloop isn't available on Windows).
+    uvicorn.run("main:app", host=host, port=port, workers=workers,
+                loop="auto", http="auto", log_level="info")
\ No newline at end of file
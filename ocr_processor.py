@@ -1,14 +1,25 @@
 import pytesseract
-from PIL import Image
+import numpy as np
+from PIL import Image, ImageOps
+import asyncio
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+import hashlib
 import io
+import os
 import re
+import shlex
+import subprocess
+import tempfile
 from datetime import datetime
 from typing import Union
 import logging
+import uuid
+from cachetools import TTLCache
+from fastapi import HTTPException
+from config import OCR_PREPROCESS, OCR_WORKERS
 from models import PrescriptionData
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # --- Configuration ---
@@ -18,120 +29,449 @@ logger = logging.getLogger(__name__)
 # If running in a container or specific environment, ensure Tesseract is installed and accessible.
 # You might need to install language packs as well (e.g., `sudo apt-get install tesseract-ocr-eng`)
 
+# LSTM engine only (--oem 1) and a single uniform block of text (--psm 6), which suits
+# prescriptions and skips Tesseract's slower automatic page segmentation.
+# For faster recognition, point TESSDATA_PREFIX at the `tessdata_fast` models.
+OCR_LANG = "eng"
+TESSERACT_CONFIG = "--oem 1 --psm 6"
+
+def _detect_tessdata_dir() -> str:
+    """Returns the trained-data directory Tesseract actually uses, as reported by `tesseract --list-langs`."""
+    try:
+        result = subprocess.run([pytesseract.pytesseract.tesseract_cmd, "--list-langs"],
+                                capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError) as e:
+        return f"<unknown: {e}>"
+    # First line looks like: List of available languages in "/usr/share/tessdata/" (3):
+    output = result.stdout or result.stderr
+    first_line = output.splitlines()[0] if output else ""
+    match = re.search(r'"([^"]*)"', first_line)
+    return match.group(1) if match else f"<unknown: {first_line or 'no output'}>"
+
+def log_tesseract_info():
+    """Logs the detected Tesseract version and trained-data directory so regressions are visible."""
+    try:
+        version = pytesseract.get_tesseract_version()
+    except pytesseract.TesseractNotFoundError:
+        logger.error("Tesseract is not installed or not in your PATH. OCR requests will fail.")
+        return
+    tessdata_dir = _detect_tessdata_dir()
+    logger.info(f"Using Tesseract {version} with trained data from {tessdata_dir} (lang='{OCR_LANG}', config='{TESSERACT_CONFIG}')")
+
+# Downscale, grayscale and binarize images before OCR (unless OCR_PREPROCESS is disabled): phone photos
+# are often 12 MP colour images, and feeding Tesseract a small 1-channel image is both faster and
+# usually more accurate.
+OCR_MAX_DIMENSION = 2000 # Longest edge in pixels after downscaling
+
+class TesseractUnavailableError(RuntimeError):
+    """Raised from OCR worker processes when the Tesseract binary cannot be found."""
+
+class OCRImageError(RuntimeError):
+    """Raised for a single image that could not be OCR'd (e.g. an undecodable upload)."""
+
+def _init_worker():
+    """Initializer for OCR worker processes: keep each Tesseract run single-threaded."""
+    # Parallelism comes from the process pool; letting every Tesseract run also
+    # spin up OpenMP threads oversubscribes the CPU and slows everything down.
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+# Tesseract is CPU-bound, so it runs in a process pool instead of on the event loop.
+# Every Uvicorn worker has its own pool, so each only gets its share of the CPUs (OCR_WORKERS).
+def _new_ocr_pool() -> concurrent.futures.ProcessPoolExecutor:
+    return concurrent.futures.ProcessPoolExecutor(max_workers=OCR_WORKERS, initializer=_init_worker)
+
+_OCR_POOL = _new_ocr_pool()
+
+async def _run_in_ocr_pool(func, *args):
+    """
+    Runs func(*args) in the OCR process pool. If a worker process died (e.g. killed by the OOM
+    killer), the pool is unusable from then on, so it is replaced before the error is re-raised.
+    """
+    global _OCR_POOL
+    pool = _OCR_POOL
+    try:
+        return await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+    except BrokenProcessPool:
+        if _OCR_POOL is pool: # Concurrent callers see the same broken pool; only replace it once
+            logger.error("An OCR worker process died unexpectedly; restarting the OCR process pool.")
+            pool.shutdown(wait=False, cancel_futures=True)
+            _OCR_POOL = _new_ocr_pool()
+        raise
+
+def _otsu_threshold(gray: np.ndarray) -> int:
+    """Computes Otsu's binarization threshold for an 8-bit grayscale array."""
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    levels = np.arange(256, dtype=np.float64)
+    weight_bg = np.cumsum(hist)
+    weight_fg = gray.size - weight_bg
+    sum_bg = np.cumsum(hist * levels)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_bg = sum_bg / weight_bg
+        mean_fg = (sum_bg[-1] - sum_bg) / weight_fg
+        between_var = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+    # Thresholds with an empty class are undefined (NaN); treat them as the worst split
+    return int(np.argmax(np.nan_to_num(between_var, nan=-1.0)))
+
+def _preprocess_image(image: Image.Image) -> Image.Image:
+    """Orients, downscales, grayscales and Otsu-binarizes an image for OCR."""
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((OCR_MAX_DIMENSION, OCR_MAX_DIMENSION), Image.Resampling.LANCZOS)
+    gray = np.asarray(image.convert("L"))
+    threshold = _otsu_threshold(gray)
+    return Image.fromarray(np.where(gray > threshold, 255, 0).astype(np.uint8))
+
+def _load_image(image_bytes: bytes) -> Image.Image:
+    """Opens the image bytes, preprocessing them for OCR unless OCR_PREPROCESS is disabled."""
+    image = Image.open(io.BytesIO(image_bytes))
+    return _preprocess_image(image) if OCR_PREPROCESS else image
+
+def _ocr_sync(image_bytes: bytes) -> str:
+    """Runs Tesseract on the image bytes. Executed inside an OCR worker process."""
+    try:
+        image = _load_image(image_bytes)
+        return pytesseract.image_to_string(image, lang=OCR_LANG, config=TESSERACT_CONFIG)
+    except pytesseract.TesseractNotFoundError as e:
+        # TesseractNotFoundError cannot be unpickled in the parent process, so re-raise a plain error
+        raise TesseractUnavailableError(str(e)) from None
+
+def _ocr_one(image_bytes: bytes) -> Union[str, Exception]:
+    """Runs _ocr_sync on one image, returning its error instead of raising so it can't fail a whole batch."""
+    try:
+        return _ocr_sync(image_bytes)
+    except TesseractUnavailableError as e:
+        return e
+    except Exception as e:
+        return OCRImageError(f"{type(e).__name__}: {e}")
+
+def _ocr_batch_sync(images: list[bytes]) -> list[Union[str, Exception]]:
+    """
+    Runs Tesseract once over several images using its file-list input, so process startup and
+    model loading are paid once per batch. Executed inside an OCR worker process.
+    Returns one result per image: its OCR text, or the error for that image alone.
+    Falls back to one Tesseract run per image if the batch run fails or its pages don't line up.
+    """
+    results: list[Union[str, Exception, None]] = [None] * len(images)
+    batch_indexes = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        image_paths = []
+        for i, image_bytes in enumerate(images):
+            image_path = os.path.join(tmp_dir, f"image_{i}")
+            try:
+                if OCR_PREPROCESS:
+                    _load_image(image_bytes).save(image_path, format="PNG")
+                else:
+                    with open(image_path, "wb") as f:
+                        f.write(image_bytes)
+            except Exception as e:
+                # An undecodable upload only fails its own request
+                results[i] = OCRImageError(f"{type(e).__name__}: {e}")
+                continue
+            batch_indexes.append(i)
+            image_paths.append(image_path)
+
+        combined_text = None
+        if len(image_paths) > 1:
+            list_path = os.path.join(tmp_dir, "filelist.txt")
+            with open(list_path, "w") as f:
+                f.write("\n".join(image_paths) + "\n")
+
+            output_base = os.path.join(tmp_dir, "output")
+            cmd = [pytesseract.pytesseract.tesseract_cmd, list_path, output_base,
+                   "-l", OCR_LANG, *shlex.split(TESSERACT_CONFIG)]
+            try:
+                subprocess.run(cmd, check=True, capture_output=True)
+                with open(f"{output_base}.txt", encoding="utf-8") as f:
+                    combined_text = f.read()
+            except FileNotFoundError as e:
+                raise TesseractUnavailableError(str(e)) from None
+            except subprocess.CalledProcessError:
+                combined_text = None
+
+    # Tesseract terminates every page with a form feed, so N images give N+1 parts
+    pages = combined_text.split("\f") if combined_text is not None else []
+    if len(pages) == len(batch_indexes) + 1:
+        for i, page in zip(batch_indexes, pages):
+            results[i] = page + "\f"
+    else:
+        # A failed run, a lone remaining image or a multi-frame image (e.g. TIFF) breaks the
+        # one-page-per-image mapping, so OCR each image on its own
+        for i in batch_indexes:
+            results[i] = _ocr_one(images[i])
+    return results
+
+# --- OCR Micro-Batching ---
+# While the process pool has idle workers, each request is dispatched on its own so images are
+# OCR'd in parallel. Once every worker is busy, a new request would only wait in the pool's queue,
+# so requests arriving within OCR_BATCH_TIMEOUT seconds are coalesced and split evenly into one
+# batch per worker (each up to OCR_BATCH_SIZE images and run by a single Tesseract call), so that
+# every worker picks up a share as it frees up instead of one worker running them all in sequence.
+
+OCR_BATCH_SIZE = 8
+OCR_BATCH_TIMEOUT = 0.02
+
+_ocr_queue: asyncio.Queue | None = None
+_ocr_batcher_task: asyncio.Task | None = None
+_ocr_batch_tasks: set[asyncio.Task] = set()
+_ocr_jobs_in_flight = 0 # Jobs submitted to the process pool and not finished yet
+
+async def _run_ocr_batch(batch: list[tuple[bytes, asyncio.Future]]):
+    """Runs one batch in the process pool and resolves each caller's future."""
+    global _ocr_jobs_in_flight
+    images = [image_bytes for image_bytes, _ in batch]
+    futures = [future for _, future in batch]
+    try:
+        if len(images) == 1:
+            # A single image doesn't benefit from the file-list run, so skip its overhead
+            results = [await _run_in_ocr_pool(_ocr_one, images[0])]
+        else:
+            logger.info(f"Running batched OCR over {len(images)} images")
+            results = await _run_in_ocr_pool(_ocr_batch_sync, images)
+    except Exception as e:
+        for future in futures:
+            if not future.done():
+                future.set_exception(e)
+        return
+    finally:
+        _ocr_jobs_in_flight -= 1
+    for future, result in zip(futures, results):
+        if future.done(): # The caller may have gone away (e.g. client disconnected)
+            continue
+        if isinstance(result, Exception):
+            future.set_exception(result)
+        else:
+            future.set_result(result)
+
+async def _ocr_batcher():
+    """Background task: dispatches queued OCR requests, batching them while the pool is saturated."""
+    global _ocr_jobs_in_flight
+    loop = asyncio.get_running_loop()
+    while True:
+        pending = [await _ocr_queue.get()]
+        if _ocr_jobs_in_flight >= OCR_WORKERS:
+            deadline = loop.time() + OCR_BATCH_TIMEOUT
+            while len(pending) < OCR_BATCH_SIZE * OCR_WORKERS:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    pending.append(await asyncio.wait_for(_ocr_queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+        # Deal the requests round-robin into at most one batch per worker
+        for batch in (pending[i::OCR_WORKERS] for i in range(min(OCR_WORKERS, len(pending)))):
+            _ocr_jobs_in_flight += 1
+            task = asyncio.create_task(_run_ocr_batch(batch))
+            _ocr_batch_tasks.add(task)
+            task.add_done_callback(_ocr_batch_tasks.discard)
+
+def start_ocr_batcher():
+    """Starts the OCR batching task. Call from the application's startup event."""
+    global _ocr_queue, _ocr_batcher_task
+    if _ocr_batcher_task is None:
+        _ocr_queue = asyncio.Queue()
+        _ocr_batcher_task = asyncio.create_task(_ocr_batcher())
+        logger.info(f"OCR batcher started (batch size {OCR_BATCH_SIZE}, timeout {OCR_BATCH_TIMEOUT}s).")
+
+def stop_ocr_batcher():
+    """Stops the OCR batching task. Call from the application's shutdown event."""
+    global _ocr_queue, _ocr_batcher_task
+    if _ocr_batcher_task is not None:
+        _ocr_batcher_task.cancel()
+        _ocr_batcher_task = None
+        _ocr_queue = None
+
+async def run_ocr(image_bytes: bytes) -> str:
+    """Returns the OCR text for the image, going through the batcher when it is running."""
+    if _ocr_queue is None:
+        # No batcher (e.g. when this module is used outside the API): run the image on its own
+        return await _run_in_ocr_pool(_ocr_sync, image_bytes)
+    future = asyncio.get_running_loop().create_future()
+    await _ocr_queue.put((image_bytes, future))
+    return await future
+
+# --- Precompiled Patterns ---
+# Compiled once at import time so the extraction helpers don't rebuild patterns on every request.
+# Patterns are lowercase and case-sensitive: the OCR text is lowercased once per request
+# (see lowercase_text) and searched with these, and match offsets index back into the original text.
+
+# Every keyword is found in a single pass over the text; each named group is one keyword.
+# Field keywords end at their colon, notes keywords include the separators that follow them.
+_FIELD_KEYWORDS = {"patient_name": "patient name", "name": "name", "age": "age", "gender": "gender", "sex": "sex"}
+_NOTES_KEYWORDS = {kw: kw for kw in ("rx", "diagnosis", "notes", "advice", "medication", "prescription")}
+_KEYWORDS_RE = re.compile("|".join(
+    [rf"(?P<{group}>{kw}:)" for group, kw in _FIELD_KEYWORDS.items()]
+    + [rf"(?P<{group}>{kw}[\s:]+)" for group, kw in _NOTES_KEYWORDS.items()]
+))
+
+# Keywords for each field, in order of preference
+_NAME_KEYS = ("patient_name", "name")
+_AGE_KEYS = ("age",)
+_GENDER_KEYS = ("gender", "sex")
+_NOTES_KEYS = tuple(_NOTES_KEYWORDS)
+
+# The value following a field keyword: optional whitespace, then the rest of that line
+_VALUE_RE = re.compile(r"\s*(.*)")
+
+# Common date shapes fused into one pattern (add more as needed); the named group
+# that matched tells extract_date which strptime formats can apply
+_MONTHS = r'(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*'
+_DATE_RE = re.compile(
+    r'(?P<dmy_slash>\d{1,2}/\d{1,2}/\d{2,4})' # DD/MM/YYYY
+    r'|(?P<dmy_dash>\d{1,2}-\d{1,2}-\d{2,4})' # DD-MM-YYYY
+    rf'|(?P<d_b_Y>\d{{1,2}}\s+{_MONTHS}\s+\d{{2,4}})' # DD Month YYYY
+    rf'|(?P<b_d_Y>{_MONTHS}\s+\d{{1,2}},?\s+\d{{2,4}})' # Month DD, YYYY
+)
+_DATE_FORMATS = {
+    "dmy_slash": ("%d/%m/%Y", "%d/%m/%y", "%m/%d/%Y", "%m/%d/%y"),
+    "dmy_dash": ("%d-%m-%Y", "%d-%m-%y", "%m-%d-%Y", "%m-%d-%y"),
+    "d_b_Y": ("%d %b %Y", "%d %B %Y"),
+    "b_d_Y": ("%b %d %Y", "%B %d %Y", "%b %d, %Y", "%B %d, %Y"),
+}
+
+# Trailing keywords on the same line as an extracted value (matched against the original casing)
+_VALUE_SPLIT = re.compile(r'\s{2,}|[A-Z][a-z]+:')
+# End of the notes section (blank line or signature block)
+_NOTES_STOP = re.compile(r'\n\s*\n|Signature:|Doctor:')
+
 # --- Helper Functions for Extraction ---
 
-def extract_field(text: str, keywords: list[str], pattern: str = r":\s*(.*)") -> Union[str, None]:
-    """Generic function to find a keyword and extract the value after it."""
-    for keyword in keywords:
-        # Case-insensitive search for the keyword
-        match = re.search(f"{keyword}{pattern}", text, re.IGNORECASE)
-        if match:
+def lowercase_text(text: str) -> str:
+    """
+    Lowercases the text for keyword searches, keeping every character at the same offset.
+    A few characters (e.g. 'İ') grow when lowercased; those are left as-is so offsets still line up.
+    """
+    text_lc = text.lower()
+    if len(text_lc) == len(text):
+        return text_lc
+    return "".join(c.lower() if len(c.lower()) == 1 else c for c in text)
+
+def scan_keywords(text_lc: str) -> dict[str, int]:
+    """
+    Finds the first occurrence of every keyword in the lowercased text in a single pass.
+
+    Returns:
+        A dict mapping each keyword's group name to the offset just past its first occurrence.
+    """
+    keyword_ends = {}
+    for match in _KEYWORDS_RE.finditer(text_lc):
+        keyword_ends.setdefault(match.lastgroup, match.end())
+        if match.lastgroup == "patient_name":
+            # "patient name:" also contains "name:", which the scan can't match separately
+            keyword_ends.setdefault("name", match.end())
+        if len(keyword_ends) == len(_FIELD_KEYWORDS) + len(_NOTES_KEYWORDS):
+            break
+    return keyword_ends
+
+def extract_field(text: str, keyword_ends: dict[str, int], keys: tuple[str, ...]) -> Union[str, None]:
+    """Generic function to extract the value after the first keyword (in order of preference) that has one."""
+    for key in keys:
+        end = keyword_ends.get(key)
+        if end is not None:
             # Clean up the extracted value
-            value = match.group(1).strip()
+            value = _VALUE_RE.match(text, end).group(1).strip()
             # Remove potential trailing keywords from the same line
-            value = re.split(r'\s{2,}|[A-Z][a-z]+:', value)[0].strip()
+            value = _VALUE_SPLIT.split(value, 1)[0].strip()
             if value:
                 return value
     return None
 
-def extract_date(text: str) -> Union[datetime.date, None]:
-    """Attempts to find and parse a date from the text."""
-    # Common date patterns (add more as needed)
-    patterns = [
-        r'\d{1,2}[/-]\d{1,2}[/-]\d{2,4}', # DD/MM/YYYY, DD-MM-YYYY, etc.
-        r'\d{1,2}\s+(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+\d{2,4}', # DD Month YYYY
-        r'(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+\d{1,2},?\s+\d{2,4}' # Month DD, YYYY
-    ]
-    for pattern in patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            date_str = match.group(0)
-            # Try parsing with common formats
-            for fmt in ["%d/%m/%Y", "%d-%m-%Y", "%d/%m/%y", "%d-%m-%y",
-                        "%d %b %Y", "%d %B %Y", "%b %d %Y", "%B %d %Y",
-                        "%m/%d/%Y", "%m-%d-%Y", "%m/%d/%y", "%m-%d-%y"]:
-                 try:
-                     return datetime.strptime(date_str, fmt).date()
-                 except ValueError:
-                     continue
+def extract_date(text_lc: str) -> Union[datetime.date, None]:
+    """Attempts to find and parse a date from the lowercased text."""
+    for match in _DATE_RE.finditer(text_lc):
+        date_str = match.group(0)
+        # Only try the formats that fit the shape that matched
+        for fmt in _DATE_FORMATS[match.lastgroup]:
+            try:
+                return datetime.strptime(date_str, fmt).date()
+            except ValueError:
+                continue
     logger.warning("Could not extract or parse date from OCR text.")
     return None
 
-def extract_notes(text: str) -> Union[str, None]:
+def extract_notes(text: str, keyword_ends: dict[str, int]) -> Union[str, None]:
     """Attempts to extract doctor's notes (often follows keywords like Rx, Diagnosis, Notes)."""
-    # Simple approach: Look for sections starting with common keywords
-    keywords = ["Rx", "Diagnosis", "Notes", "Advice", "Medication", "Prescription"]
-    best_guess = None
-    start_index = -1
-
-    for keyword in keywords:
-        # Use raw string (r"...") or escape backslash (\\s) for regex patterns
-        match = re.search(rf"({keyword}[\s:]+)", text, re.IGNORECASE)
-        if match:
-            current_start = match.end()
-            # If this keyword appears later in the text, it might be a better starting point
-            if current_start > start_index:
-                start_index = current_start
-                # Take a reasonable chunk of text after the keyword
-                # This is a heuristic and might need significant improvement
-                potential_notes = text[start_index:].strip()
-                # Try to limit the notes section (e.g., stop at next major section or signature)
-                potential_notes = re.split(r'\n\s*\n|Signature:|Doctor:', potential_notes, 1)[0].strip()
-                best_guess = potential_notes
-
-    if best_guess:
-        return best_guess
-    else:
-        # Fallback: return a portion of the text if no keywords found? Risky.
-        logger.warning("Could not clearly identify doctor's notes section.")
-        return None # Or potentially return a large chunk of the lower part of the text
+    # Simple approach: the notes section starts after whichever keyword appears last
+    # This is a heuristic and might need significant improvement
+    start_index = max((keyword_ends[key] for key in _NOTES_KEYS if key in keyword_ends), default=None)
+    if start_index is not None:
+        # Take a reasonable chunk of text after the keyword
+        potential_notes = text[start_index:].strip()
+        # Try to limit the notes section (e.g., stop at next major section or signature)
+        best_guess = _NOTES_STOP.split(potential_notes, 1)[0].strip()
+        if best_guess:
+            return best_guess
+
+    # Fallback: return a portion of the text if no keywords found? Risky.
+    logger.warning("Could not clearly identify doctor's notes section.")
+    return None # Or potentially return a large chunk of the lower part of the text
+
+# --- OCR Result Cache ---
+# Flaky mobile clients often retry the same upload. Successful results are cached by the
+# SHA-256 of the image so a retry skips OCR entirely. hashlib uses the CPU's SHA
+# extensions (SHA-NI) when available, so hashing costs far less than the OCR it saves.
+_OCR_RESULT_CACHE: TTLCache[bytes, PrescriptionData] = TTLCache(maxsize=1024, ttl=600)
 
 # --- Main Processing Function ---
 
-async def process_prescription_image(image_bytes: bytes) -> PrescriptionData:
+async def process_prescription_image(image_bytes: Union[bytes, memoryview]) -> PrescriptionData:
     """
     Processes prescription image bytes using Tesseract OCR and extracts structured data.
 
     Args:
-        image_bytes: The prescription image file in bytes.
+        image_bytes: The prescription image file as bytes or a memoryview over a buffer.
 
     Returns:
         A PrescriptionData object containing the extracted information.
     """
     logger.info("Starting prescription image processing...")
+    digest = hashlib.sha256(image_bytes).digest()
+    cached_data = _OCR_RESULT_CACHE.get(digest)
+    if cached_data is not None:
+        logger.info("Image already processed recently; reusing cached OCR results.")
+        # Each upload still gets its own record, so only the extracted fields are reused
+        return cached_data.model_copy(update={"patient_id": str(uuid.uuid4())})
+
     extracted_data = PrescriptionData() # Initialize with defaults
 
     try:
-        # Open image from bytes
-        image = Image.open(io.BytesIO(image_bytes))
-
-        # Perform OCR
-        # Consider adding '--psm' options (e.g., 6 for assuming a single uniform block of text)
-        # Consider adding '-l eng' for English language explicitly
+        # Perform OCR in a worker process (batched with concurrent uploads) so the event loop stays free
         logger.info("Performing OCR using Tesseract...")
-        ocr_text = pytesseract.image_to_string(image)
-        logger.info(f"OCR Raw Text (first 500 chars): {ocr_text[:500]}...")
+        # The process boundary needs picklable bytes; this is the only place a memoryview is copied
+        # (bytes() returns the same object when it's already bytes)
+        ocr_text = await run_ocr(bytes(image_bytes))
+        # Debug level with lazy %-formatting: OCR text can be long and contains patient details
+        logger.debug("OCR Raw Text (first 500 chars): %s...", ocr_text[:500])
         extracted_data.raw_ocr_text = ocr_text
 
         # --- Extract Fields (Basic Implementation) ---
         # These extractions are basic and may require significant tuning based on actual prescription formats
         logger.info("Attempting to extract structured fields...")
 
-        extracted_data.name = extract_field(ocr_text, ["Patient Name", "Name"])
-        extracted_data.age = extract_field(ocr_text, ["Age"])
-        extracted_data.gender = extract_field(ocr_text, ["Gender", "Sex"])
-        extracted_data.visit_date = extract_date(ocr_text)
-        extracted_data.doctor_notes = extract_notes(ocr_text)
+        # Lowercase once, then find all keywords in one pass and all dates in another
+        ocr_text_lc = lowercase_text(ocr_text)
+        keyword_ends = scan_keywords(ocr_text_lc)
+        extracted_data.name = extract_field(ocr_text, keyword_ends, _NAME_KEYS)
+        extracted_data.age = extract_field(ocr_text, keyword_ends, _AGE_KEYS)
+        extracted_data.gender = extract_field(ocr_text, keyword_ends, _GENDER_KEYS)
+        extracted_data.visit_date = extract_date(ocr_text_lc)
+        extracted_data.doctor_notes = extract_notes(ocr_text, keyword_ends)
 
         # Log extracted fields
-        logger.info(f"Extraction Results: Name='{extracted_data.name}', Age='{extracted_data.age}', "
-                    f"Gender='{extracted_data.gender}', Date='{extracted_data.visit_date}', "
-                    f"Notes='{extracted_data.doctor_notes[:100] if extracted_data.doctor_notes else None}...'")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Extraction Results: Name='%s', Age='%s', Gender='%s', Date='%s', Notes='%s...'",
+                         extracted_data.name, extracted_data.age, extracted_data.gender, extracted_data.visit_date,
+                         extracted_data.doctor_notes[:100] if extracted_data.doctor_notes else None)
 
-    except pytesseract.TesseractNotFoundError:
+        _OCR_RESULT_CACHE[digest] = extracted_data
+
+    except TesseractUnavailableError:
         logger.error("Tesseract is not installed or not in your PATH. Please install Tesseract.")
         # Re-raise or handle appropriately depending on desired API behavior
         raise HTTPException(status_code=500, detail="OCR processing failed: Tesseract not found.")
+    except BrokenProcessPool:
+        # The OCR worker crashed, so there is no OCR text: fail the request rather than save an empty record
+        logger.error("OCR worker process crashed while processing the image.")
+        raise HTTPException(status_code=503, detail="OCR processing failed: the OCR worker crashed. Please retry.")
     except Exception as e:
         logger.error(f"Error processing image or extracting data: {e}")
         # Include raw text in the response even if extraction fails partially
@@ -144,6 +484,7 @@ async def process_prescription_image(image_bytes: bytes) -> PrescriptionData:
 # Example usage (for testing purposes)
 if __name__ == '__main__':
     # This part runs only when the script is executed directly
+    logging.basicConfig(level=logging.INFO)
     # Replace 'path/to/your/test_prescription.png' with an actual image file
     try:
         with open('path/to/your/test_prescription.png', 'rb') as f:
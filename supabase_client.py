@@ -1,34 +1,69 @@
-import os
-from supabase import create_client, Client
-from dotenv import load_dotenv
+import httpx
+from cachetools import TTLCache
+from supabase import acreate_client, AsyncClient, AsyncClientOptions
+from config import SUPABASE_URL, SUPABASE_KEY, TABLE_NAME
 from models import PrescriptionData
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Load environment variables from .env file
-load_dotenv()
+# Connection pool shared by all Supabase requests. Keeping connections alive means only the
+# first request pays the TCP/TLS handshake to Supabase.
+SUPABASE_HTTP_LIMITS = httpx.Limits(max_keepalive_connections=32, max_connections=64, keepalive_expiry=60.0)
+SUPABASE_HTTP_TIMEOUT = 120.0 # Matches postgrest-py's default client timeout
 
-# Get Supabase credentials from environment variables
-supabase_url: str = os.environ.get("SUPABASE_URL")
-supabase_key: str = os.environ.get("SUPABASE_KEY")
+# Async Supabase client, created by init_supabase() on application startup so that
+# database calls don't block the event loop while waiting on the network
+supabase: AsyncClient = None
+_http_client: httpx.AsyncClient = None
 
-# Initialize Supabase client
-supabase: Client = None
-if supabase_url and supabase_key:
-    try:
-        supabase = create_client(supabase_url, supabase_key)
-        logger.info("Supabase client initialized successfully.")
-    except Exception as e:
-        logger.error(f"Error initializing Supabase client: {e}")
-        # Depending on the desired behavior, you might want to exit or handle this differently
-else:
-    logger.warning("Supabase URL or Key not found in environment variables. Supabase client not initialized.")
+async def init_supabase() -> AsyncClient | None:
+    """
+    Initializes the shared async Supabase client. Call once from the application's startup event.
+    Also issues a small warm-up query so the first real request reuses an open connection.
 
-# Define the table name in Supabase
-TABLE_NAME = "prescriptions"
+    Returns:
+        AsyncClient | None: The initialized client, or None if it could not be created.
+    """
+    global supabase, _http_client
+    if supabase:
+        return supabase
+    if SUPABASE_URL and SUPABASE_KEY:
+        try:
+            _http_client = httpx.AsyncClient(
+                limits=SUPABASE_HTTP_LIMITS,
+                timeout=SUPABASE_HTTP_TIMEOUT,
+                follow_redirects=True,
+                http2=True,
+            )
+            supabase = await acreate_client(SUPABASE_URL, SUPABASE_KEY,
+                                            options=AsyncClientOptions(httpx_client=_http_client))
+            logger.info("Supabase client initialized successfully.")
+        except Exception as e:
+            logger.error(f"Error initializing Supabase client: {e}")
+            # Depending on the desired behavior, you might want to exit or handle this differently
+            return supabase
+
+        try:
+            await supabase.table(TABLE_NAME).select("patient_id").limit(1).execute()
+            logger.info("Supabase connection warmed up.")
+        except Exception as e:
+            logger.warning(f"Supabase warm-up query failed: {e}")
+    else:
+        logger.warning("Supabase URL or Key not found in environment variables. Supabase client not initialized.")
+    return supabase
+
+async def close_supabase():
+    """Closes the Supabase connection pool. Call from the application's shutdown event."""
+    global supabase, _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+    supabase = None
+    _http_client = None
+
+# Records are write-once (each upload gets a new patient_id), so recently saved or
+# fetched records can be served from memory instead of another Supabase round-trip
+_PATIENT_CACHE: TTLCache[str, dict] = TTLCache(maxsize=10_000, ttl=300)
 
 async def save_prescription_data(data: PrescriptionData) -> tuple[dict | None, str | None]:
     """
@@ -47,22 +82,23 @@ async def save_prescription_data(data: PrescriptionData) -> tuple[dict | None, s
         return None, error_msg
 
     try:
-        # Convert Pydantic model to dictionary, handling potential date conversion
-        data_dict = data.dict()
-        if data_dict.get('visit_date'):
-             data_dict['visit_date'] = str(data_dict['visit_date']) # Ensure date is string for Supabase
+        # Convert Pydantic model to a JSON-ready dictionary (dates become ISO strings for Supabase)
+        data_dict = data.model_dump(mode="json")
 
-        logger.info(f"Attempting to insert data into Supabase table '{TABLE_NAME}': {data_dict}")
+        logger.debug("Inserting row into Supabase table '%s' for patient_id=%s", TABLE_NAME, data_dict.get("patient_id"))
 
         # Insert data into the table
-        response = supabase.table(TABLE_NAME).insert(data_dict).execute()
+        response = await supabase.table(TABLE_NAME).insert(data_dict).execute()
 
-        logger.info(f"Supabase insert response: {response}")
+        logger.debug("Supabase insert response: %s", response)
 
         # Check if the insert was successful (Supabase API v2 returns data in response.data)
         if response.data and len(response.data) > 0:
             saved_record = response.data[0]
             logger.info(f"Data successfully saved to Supabase with patient_id: {saved_record.get('patient_id')}")
+            # Warm the cache so the first lookup after an upload doesn't hit the database
+            if saved_record.get('patient_id'):
+                _PATIENT_CACHE[str(saved_record['patient_id'])] = saved_record
             return saved_record, None
         else:
             # Log the full response if data is empty or missing
@@ -99,14 +135,20 @@ async def get_patient_data_from_db(patient_id: str) -> tuple[dict | None, str |
         logger.error(error_msg)
         return None, error_msg
 
+    cached_record = _PATIENT_CACHE.get(patient_id)
+    if cached_record is not None:
+        logger.info(f"Returning cached data for patient_id: {patient_id}")
+        return cached_record, None
+
     try:
         logger.info(f"Attempting to retrieve data from Supabase table '{TABLE_NAME}' for patient_id: {patient_id}")
-        response = supabase.table(TABLE_NAME).select("*").eq("patient_id", patient_id).execute()
-        logger.info(f"Supabase select response: {response}")
+        response = await supabase.table(TABLE_NAME).select("*").eq("patient_id", patient_id).execute()
+        logger.debug("Supabase select response: %s", response)
 
         if response.data and len(response.data) > 0:
             patient_record = response.data[0]
             logger.info(f"Data successfully retrieved for patient_id: {patient_id}")
+            _PATIENT_CACHE[patient_id] = patient_record
             return patient_record, None
         elif not response.data:
              logger.warning(f"No data found for patient_id: {patient_id}")